@@ -3,12 +3,18 @@ Database configuration and models for MySQL integration
 """
 
 import os
+from contextvars import ContextVar
 from datetime import datetime
 from typing import Optional
-from sqlalchemy import create_engine, Column, String, Text, DateTime, Integer, Enum, ForeignKey, Index
+from sqlalchemy import Column, String, Text, DateTime, Integer, ForeignKey, Index, func, text
+from sqlalchemy.ext.asyncio import (
+    create_async_engine,
+    async_scoped_session,
+    async_sessionmaker,
+    AsyncSession,
+)
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker, relationship
-from sqlalchemy.dialects.mysql import LONGTEXT
+from sqlalchemy.orm import relationship
 
 # Database configuration
 MYSQL_HOST = os.getenv("MYSQL_HOST", "localhost")
@@ -17,34 +23,52 @@ MYSQL_USER = os.getenv("MYSQL_USER", "root")
 MYSQL_PASSWORD = os.getenv("MYSQL_PASSWORD", "root1234")
 MYSQL_DATABASE = os.getenv("MYSQL_DATABASE", "computer_use_demo")
 
-# Create database URL
-DATABASE_URL = f"mysql://{MYSQL_USER}:{MYSQL_PASSWORD}@{MYSQL_HOST}:{MYSQL_PORT}/{MYSQL_DATABASE}"
+# Create database URL (asyncmy driver so queries don't block the event loop)
+DATABASE_URL = f"mysql+asyncmy://{MYSQL_USER}:{MYSQL_PASSWORD}@{MYSQL_HOST}:{MYSQL_PORT}/{MYSQL_DATABASE}"
 
 # Create engine
-engine = create_engine(
+# Pool is sized for ~4 uvicorn workers: each worker gets up to
+# pool_size + max_overflow connections, so keep MySQL max_connections
+# above workers * (pool_size + max_overflow)
+engine = create_async_engine(
     DATABASE_URL,
-    pool_pre_ping=True,
+    pool_size=20,
+    max_overflow=40,
+    pool_timeout=30,
+    # pool_recycle well below MySQL's wait_timeout makes pre-ping's
+    # SELECT 1 per checkout redundant
+    pool_pre_ping=False,
     pool_recycle=300,
     echo=False
 )
 
 # Create session factory
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+_session_factory = async_sessionmaker(
+    bind=engine,
+    class_=AsyncSession,
+    autoflush=False,
+    expire_on_commit=False
+)
+
+# Scope token set by the session middleware in main.py; every call within
+# a request resolves to the same scoped session, and the middleware calls
+# SessionLocal.remove() at request end
+_request_scope: ContextVar[Optional[object]] = ContextVar("req_scope", default=None)
+
+SessionLocal = async_scoped_session(_session_factory, scopefunc=_request_scope.get)
 
 # Create base class for models
 Base = declarative_base()
 
 # Database dependency
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
+def get_db() -> AsyncSession:
+    """Return the scoped session for the current request"""
+    return SessionLocal()
 
 # Initialize database
-def init_db():
-    Base.metadata.create_all(bind=engine)
+async def init_db():
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
 
 # Session model
 class Session(Base):
@@ -52,15 +76,25 @@ class Session(Base):
     
     id = Column(String(36), primary_key=True, index=True)
     name = Column(String(255), nullable=False)
-    status = Column(Enum('idle', 'running', 'completed', 'error'), default='idle')
-    created_at = Column(DateTime, default=datetime.utcnow)
-    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    # idle, running, completed, error — plain VARCHAR so adding a value
+    # doesn't require an ENUM-altering table rewrite
+    status = Column(String(16), default='idle')
+    created_at = Column(DateTime, server_default=func.now())
+    # MySQL maintains this on every UPDATE, so handlers never set it manually
+    updated_at = Column(DateTime, server_default=text("CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP"))
     
-    # Relationship to messages
-    messages = relationship("Message", back_populates="session", cascade="all, delete-orphan")
+    # Relationship to messages, ordered to match idx_session_timestamp
+    messages = relationship(
+        "Message",
+        back_populates="session",
+        cascade="all, delete-orphan",
+        order_by="Message.timestamp"
+    )
     
     __table_args__ = (
-        Index('idx_status', 'status'),
+        # Composite index covers status-filtered dashboard listings ordered
+        # by recency; a plain status index would be redundant
+        Index('idx_status_updated', 'status', 'updated_at'),
         Index('idx_created_at', 'created_at'),
     )
 
@@ -70,11 +104,13 @@ class Message(Base):
     
     id = Column(Integer, primary_key=True, autoincrement=True)
     session_id = Column(String(36), ForeignKey("sessions.id", ondelete="CASCADE"), nullable=False)
-    role = Column(Enum('user', 'assistant', 'tool', 'system'), nullable=False)
+    role = Column(String(16), nullable=False)  # user, assistant, tool, system
     content = Column(Text, nullable=False)
-    message_type = Column(Enum('text', 'tool_result', 'screenshot', 'error'), default='text')
+    message_type = Column(String(16), default='text')  # text, tool_result, screenshot, error
     tool_name = Column(String(255), nullable=True)
-    screenshot = Column(LONGTEXT, nullable=True)  # base64 encoded image
+    # Screenshots live on disk as binary files; only the URL path is stored
+    # so message rows stay small
+    screenshot_url = Column(String(512), nullable=True)
     error = Column(Text, nullable=True)
     timestamp = Column(DateTime, default=datetime.utcnow)
     
@@ -82,7 +118,8 @@ class Message(Base):
     session = relationship("Session", back_populates="messages")
     
     __table_args__ = (
-        Index('idx_session_id', 'session_id'),
+        # Composite index serves both the session filter and timestamp sort;
+        # a separate single-column session_id index would be redundant
+        Index('idx_session_timestamp', 'session_id', 'timestamp'),
         Index('idx_timestamp', 'timestamp'),
-        Index('idx_role', 'role'),
     ) 
\ No newline at end of file
@@ -3,25 +3,38 @@ FastAPI Backend for Claude Computer Use Agent Session Management
 """
 
 import asyncio
-import json
+import base64
+import os
 import uuid
 from datetime import datetime
 from typing import Dict, List, Optional
 from uuid import UUID
 
 import httpx
-from fastapi import FastAPI, HTTPException, WebSocket, WebSocketDisconnect, Depends
+import orjson
+from cachetools import TTLCache
+from fastapi import FastAPI, HTTPException, Request, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.staticfiles import StaticFiles
 from pydantic import BaseModel, Field
-from starlette.responses import StreamingResponse
-from sqlalchemy.orm import Session
+from starlette.responses import Response, StreamingResponse
+from sqlalchemy import func, insert, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
 
 # Import the real Claude agent components
 from computer_use_demo.loop import APIProvider, sampling_loop
 from computer_use_demo.tools import ToolResult, ToolVersion
 
 # Import database models
-from backend.database import get_db, Session as DBSession, Message as DBMessage, init_db
+from backend.database import (
+    get_db,
+    Session as DBSession,
+    Message as DBMessage,
+    SessionLocal,
+    _request_scope,
+    _session_factory,
+    init_db,
+)
 
 app = FastAPI(
     title="Claude Computer Use Agent API",
@@ -38,16 +51,44 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+@app.middleware("http")
+async def db_session_middleware(request: Request, call_next):
+    """Scope the database session registry to this request"""
+    token = _request_scope.set(object())
+    try:
+        response = await call_next(request)
+    finally:
+        await SessionLocal.remove()
+        _request_scope.reset(token)
+    return response
+
 # WebSocket connections (still in-memory for real-time)
 active_connections: Dict[str, List[WebSocket]] = {}
 
+# Short-TTL cache of the serialized /sessions response so N pollers cost
+# one query per TTL; invalidated on create/send_message
+_sessions_cache: TTLCache = TTLCache(maxsize=1, ttl=2)
+
+# Screenshots are stored on disk and served statically; the DB only holds
+# their URL paths
+SCREENSHOT_DIR = os.getenv("SCREENSHOT_DIR", "screenshots")
+os.makedirs(SCREENSHOT_DIR, exist_ok=True)
+app.mount("/screenshots", StaticFiles(directory=SCREENSHOT_DIR), name="screenshots")
+
+def store_screenshot(session_id: str, base64_data: str) -> str:
+    """Decode and persist a screenshot, returning its URL path"""
+    filename = f"{session_id}-{uuid.uuid4().hex}.png"
+    with open(os.path.join(SCREENSHOT_DIR, filename), "wb") as f:
+        f.write(base64.b64decode(base64_data))
+    return f"/screenshots/{filename}"
+
 class Message(BaseModel):
     role: str
     content: str
     timestamp: datetime = Field(default_factory=datetime.now)
     message_type: str = "text"  # text, tool_result, screenshot, error
     tool_name: Optional[str] = None
-    screenshot: Optional[str] = None  # base64 encoded image
+    screenshot_url: Optional[str] = None  # URL path of the stored image
     error: Optional[str] = None
 
 class Session(BaseModel):
@@ -76,7 +117,7 @@ class SessionResponse(BaseModel):
 @app.on_event("startup")
 async def startup_event():
     """Initialize database on startup"""
-    init_db()
+    await init_db()
 
 @app.get("/")
 async def root():
@@ -87,97 +128,146 @@ async def health_check():
     return {"status": "healthy", "timestamp": datetime.now()}
 
 @app.post("/sessions", response_model=SessionResponse)
-async def create_session(request: CreateSessionRequest, db: Session = Depends(get_db)):
+async def create_session(request: CreateSessionRequest):
     """Create a new agent session"""
+    db = get_db()
     session_id = str(uuid.uuid4())
-    
-    # Create session in database
-    db_session = DBSession(
-        id=session_id,
-        name=request.name,
-        status="idle"
+    now = datetime.utcnow()
+
+    # Plain INSERTs with client-computed defaults, so the response can be
+    # built from known values without a refresh SELECT
+    await db.execute(
+        insert(DBSession.__table__),
+        [{
+            "id": session_id,
+            "name": request.name,
+            "status": "idle",
+            "created_at": now,
+            "updated_at": now
+        }]
     )
-    db.add(db_session)
-    
+
     # Add initial message if provided
     if request.initial_message:
-        db_message = DBMessage(
-            session_id=session_id,
-            role="user",
-            content=request.initial_message,
-            message_type="text"
+        await db.execute(
+            insert(DBMessage.__table__),
+            [{
+                "session_id": session_id,
+                "role": "user",
+                "content": request.initial_message,
+                "message_type": "text",
+                "timestamp": now
+            }]
         )
-        db.add(db_message)
-    
-    db.commit()
-    db.refresh(db_session)
-    
+
+    await db.commit()
+    _sessions_cache.pop("sessions", None)
+
     # Initialize WebSocket connections
     active_connections[session_id] = []
-    
+
     return SessionResponse(
         id=session_id,
-        name=db_session.name,
-        status=db_session.status,
-        message_count=len(db_session.messages),
-        created_at=db_session.created_at,
-        updated_at=db_session.updated_at
+        name=request.name,
+        status="idle",
+        message_count=1 if request.initial_message else 0,
+        created_at=now,
+        updated_at=now
     )
 
 @app.get("/sessions", response_model=List[SessionResponse])
-async def list_sessions(db: Session = Depends(get_db)):
+async def list_sessions():
     """List all sessions"""
-    db_sessions = db.query(DBSession).all()
-    
-    return [
-        SessionResponse(
-            id=session.id,
-            name=session.name,
-            status=session.status,
-            message_count=len(session.messages),
-            created_at=session.created_at,
-            updated_at=session.updated_at
-        )
-        for session in db_sessions
-    ]
+    cached = _sessions_cache.get("sessions")
+    if cached is not None:
+        return Response(content=cached, media_type="application/json")
 
-@app.get("/sessions/{session_id}", response_model=Session)
-async def get_session(session_id: str, db: Session = Depends(get_db)):
-    """Get session details and messages"""
-    db_session = db.query(DBSession).filter(DBSession.id == session_id).first()
+    db = get_db()
+    # Single GROUP BY query with an aggregated message count, instead of
+    # lazy-loading every session's messages (N+1 queries)
+    result = await db.execute(
+        select(DBSession, func.count(DBMessage.id))
+        .outerjoin(DBMessage)
+        .group_by(DBSession.id)
+        .order_by(DBSession.updated_at.desc())
+    )
+    db_sessions = result.all()
+
+    # Serialize once with orjson; cache hits skip Pydantic entirely
+    payload = orjson.dumps([
+        {
+            "id": session.id,
+            "name": session.name,
+            "status": session.status,
+            "message_count": count,
+            "created_at": session.created_at,
+            "updated_at": session.updated_at
+        }
+        for session, count in db_sessions
+    ])
+    _sessions_cache["sessions"] = payload
+    return Response(content=payload, media_type="application/json")
+
+@app.get("/sessions/{session_id}")
+async def get_session(session_id: str):
+    """Get session details and messages, streamed as chunked JSON"""
+    db = get_db()
+    result = await db.execute(
+        select(DBSession).filter(DBSession.id == session_id)
+    )
+    db_session = result.scalars().first()
     if not db_session:
         raise HTTPException(status_code=404, detail="Session not found")
-    
-    # Convert database messages to Pydantic models
-    messages = []
-    for db_message in db_session.messages:
-        message = Message(
-            role=db_message.role,
-            content=db_message.content,
-            timestamp=db_message.timestamp,
-            message_type=db_message.message_type,
-            tool_name=db_message.tool_name,
-            screenshot=db_message.screenshot,
-            error=db_message.error
-        )
-        messages.append(message)
-    
-    return Session(
-        id=db_session.id,
-        name=db_session.name,
-        status=db_session.status,
-        messages=messages,
-        created_at=db_session.created_at,
-        updated_at=db_session.updated_at
-    )
+
+    header = orjson.dumps({
+        "id": db_session.id,
+        "name": db_session.name,
+        "status": db_session.status,
+        "created_at": db_session.created_at,
+        "updated_at": db_session.updated_at
+    })
+
+    async def stream_session():
+        # Splice a messages array into the session object and emit each
+        # message as it arrives, so peak memory and time-to-first-byte stay
+        # flat no matter how long the history is. The generator outlives the
+        # request-scoped session, so it streams on its own session.
+        yield header[:-1] + b',"messages":['
+        async with _session_factory() as stream_db:
+            messages = await stream_db.stream(
+                select(DBMessage)
+                .filter(DBMessage.session_id == session_id)
+                .order_by(DBMessage.timestamp)
+                .execution_options(yield_per=200)
+            )
+            first = True
+            async for db_message in messages.scalars():
+                prefix = b'' if first else b','
+                first = False
+                yield prefix + orjson.dumps({
+                    "role": db_message.role,
+                    "content": db_message.content,
+                    "timestamp": db_message.timestamp,
+                    "message_type": db_message.message_type,
+                    "tool_name": db_message.tool_name,
+                    "screenshot_url": db_message.screenshot_url,
+                    "error": db_message.error
+                })
+        yield b']}'
+
+    return StreamingResponse(stream_session(), media_type="application/json")
 
 @app.post("/sessions/{session_id}/messages")
-async def send_message(session_id: str, request: SendMessageRequest, db: Session = Depends(get_db)):
+async def send_message(session_id: str, request: SendMessageRequest):
     """Send a message to an active session"""
-    db_session = db.query(DBSession).filter(DBSession.id == session_id).first()
-    if not db_session:
+    db = get_db()
+    # Lightweight existence check instead of loading the full session row
+    result = await db.execute(
+        select(select(DBSession.id).filter_by(id=session_id).exists())
+    )
+    if not result.scalar():
         raise HTTPException(status_code=404, detail="Session not found")
-    
+
     # Add user message to database
     db_message = DBMessage(
         session_id=session_id,
@@ -186,13 +276,15 @@ async def send_message(session_id: str, request: SendMessageRequest, db: Session
         message_type="text"
     )
     db.add(db_message)
-    
-    # Update session status
-    db_session.status = "running"
-    db_session.updated_at = datetime.utcnow()
-    
-    db.commit()
-    db.refresh(db_session)
+
+    # Update session status with a targeted UPDATE, no ORM dirty-flush
+    await db.execute(
+        update(DBSession)
+        .where(DBSession.id == session_id)
+        .values(status="running")
+    )
+    await db.commit()
+    _sessions_cache.pop("sessions", None)
     
     # Notify connected clients about user message
     await broadcast_to_session(session_id, {
@@ -203,7 +295,7 @@ async def send_message(session_id: str, request: SendMessageRequest, db: Session
     })
     
     # Process with real Claude agent
-    await process_with_real_agent(db_session, request.message, db)
+    await process_with_real_agent(session_id, request.message, db)
     
     return {"status": "message sent", "session_id": session_id}
 
@@ -221,11 +313,11 @@ async def websocket_endpoint(websocket: WebSocket, session_id: str):
         while True:
             # Keep connection alive and handle incoming messages
             data = await websocket.receive_text()
-            message_data = json.loads(data)
-            
+            message_data = orjson.loads(data)
+
             # Handle different message types
             if message_data.get("type") == "ping":
-                await websocket.send_text(json.dumps({"type": "pong"}))
+                await websocket.send_bytes(orjson.dumps({"type": "pong"}))
                 
     except WebSocketDisconnect:
         if session_id in active_connections:
@@ -242,45 +334,56 @@ def safe_encode_content(content):
             return content.decode('utf-8', errors='replace')
     return str(content)
 
-async def process_with_real_agent(db_session: DBSession, user_message: str, db: Session):
+async def process_with_real_agent(session_id: str, user_message: str, db: AsyncSession):
     """Process user message with real Claude agent"""
     try:
-        # Convert session messages to Claude format
-        messages = []
-        for db_message in db_session.messages:
-            messages.append({
-                "role": db_message.role,
-                "content": [{"type": "text", "text": db_message.content}]
-            })
-        
         # Execute the agent in the computer-use-demo container where desktop environment is available
-        import subprocess
-        import json
-        
-        # Use the existing test_agent.py file and pass the message as environment variable
-        result = subprocess.run([
-            "docker", "exec", "-e", f"AGENT_MESSAGE={user_message}", "computer-use-demo", 
-            "python", "/home/computeruse/test_agent.py"
-        ], capture_output=True, text=True)
-            
-        # Process the output
-        for line in result.stdout.split('\n'):
-            if line.strip():
+        # Use the existing test_agent.py file and pass the message as environment variable.
+        # Run as an async subprocess so the event loop stays responsive while the
+        # agent works, and stream stdout line-by-line instead of waiting for exit.
+        proc = await asyncio.create_subprocess_exec(
+            "docker", "exec", "-e", f"AGENT_MESSAGE={user_message}", "computer-use-demo",
+            "python", "/home/computeruse/test_agent.py",
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
+        )
+
+        # Drain stderr in the background so a chatty agent can't fill the
+        # pipe buffer and deadlock the stdout loop
+        stderr_task = asyncio.create_task(proc.stderr.read())
+
+        # Buffer parsed messages and flush in batches so each agent line
+        # doesn't cost a full commit/fsync round-trip
+        batch_size = 10
+        pending: List[DBMessage] = []
+
+        async def flush_pending():
+            if pending:
+                db.add_all(pending)
+                await db.commit()
+                pending.clear()
+
+        # Process the output as it arrives; orjson parses the raw bytes
+        # directly, skipping a per-line decode
+        async for raw_line in proc.stdout:
+            if raw_line.strip():
                 try:
-                    data = json.loads(line)
+                    data = orjson.loads(raw_line)
                     if data.get('type') == 'output':
                         # Save assistant message
                         db_message = DBMessage(
-                            session_id=db_session.id,
+                            session_id=session_id,
                             role="assistant",
                             content=data['content'],
-                            message_type="text"
+                            message_type="text",
+                            timestamp=datetime.utcnow()
                         )
-                        db.add(db_message)
-                        db.commit()
-                        
+                        pending.append(db_message)
+                        if len(pending) >= batch_size:
+                            await flush_pending()
+
                         # Broadcast to clients
-                        await broadcast_to_session(db_session.id, {
+                        await broadcast_to_session(session_id, {
                             "type": "message",
                             "role": "assistant",
                             "content": data['content'],
@@ -291,24 +394,33 @@ async def process_with_real_agent(db_session: DBSession, user_message: str, db:
                         # Save tool output
                         safe_content = safe_encode_content(data.get('output', ''))
                         safe_error = safe_encode_content(data.get('error')) if data.get('error') else None
-                        
+
+                        # Persist any screenshot to disk; only its URL goes in the row
+                        screenshot_url = None
+                        if data.get('base64_image'):
+                            screenshot_url = store_screenshot(session_id, data['base64_image'])
+
                         db_message = DBMessage(
-                            session_id=db_session.id,
+                            session_id=session_id,
                             role="tool",
                             content=safe_content,
                             message_type="tool_result",
                             tool_name=data.get('tool_id'),
-                            error=safe_error
+                            screenshot_url=screenshot_url,
+                            error=safe_error,
+                            timestamp=datetime.utcnow()
                         )
-                        db.add(db_message)
-                        db.commit()
+                        pending.append(db_message)
+                        if len(pending) >= batch_size:
+                            await flush_pending()
                         
                         # Broadcast to clients
-                        await broadcast_to_session(db_session.id, {
+                        await broadcast_to_session(session_id, {
                             "type": "tool_result",
                             "role": "tool",
                             "content": db_message.content,
                             "tool_name": db_message.tool_name,
+                            "screenshot_url": db_message.screenshot_url,
                             "error": db_message.error,
                             "timestamp": db_message.timestamp.isoformat()
                         })
@@ -316,43 +428,56 @@ async def process_with_real_agent(db_session: DBSession, user_message: str, db:
                     elif data.get('type') == 'api_error':
                         # Save error
                         db_message = DBMessage(
-                            session_id=db_session.id,
+                            session_id=session_id,
                             role="system",
                             content=f"API Error: {data['error']}",
                             message_type="error",
-                            error=data['error']
+                            error=data['error'],
+                            timestamp=datetime.utcnow()
                         )
-                        db.add(db_message)
-                        db.commit()
+                        pending.append(db_message)
+                        if len(pending) >= batch_size:
+                            await flush_pending()
                         
                         # Broadcast to clients
-                        await broadcast_to_session(db_session.id, {
+                        await broadcast_to_session(session_id, {
                             "type": "error",
                             "role": "system",
                             "content": db_message.content,
                             "timestamp": db_message.timestamp.isoformat()
                         })
                         
-                except json.JSONDecodeError:
+                except orjson.JSONDecodeError:
                     # Skip non-JSON lines
                     continue
                 except Exception as e:
                     print(f"Error processing agent output: {e}")
-            
-            # Check for errors
-            if result.stderr:
-                print(f"Agent execution stderr: {result.stderr}")
-        
+
+        # Flush any remaining buffered messages
+        await flush_pending()
+
+        # Wait for the agent to exit and check for errors
+        await proc.wait()
+        stderr = await stderr_task
+        if stderr:
+            print(f"Agent execution stderr: {stderr.decode('utf-8', errors='replace')}")
+
         # Update session status
-        db_session.status = "idle"
-        db_session.updated_at = datetime.utcnow()
-        db.commit()
-        
+        await db.execute(
+            update(DBSession)
+            .where(DBSession.id == session_id)
+            .values(status="idle")
+        )
+        await db.commit()
+
     except Exception as e:
         # Update session status to error
-        db_session.status = "error"
-        db_session.updated_at = datetime.utcnow()
-        
+        await db.execute(
+            update(DBSession)
+            .where(DBSession.id == session_id)
+            .values(status="error")
+        )
+
         # Save error message to database
         error_content = f"Error processing message: {str(e)}"
         try:
@@ -361,17 +486,17 @@ async def process_with_real_agent(db_session: DBSession, user_message: str, db:
             error_content = "Error processing message: Unknown error"
             
         db_message = DBMessage(
-            session_id=db_session.id,
+            session_id=session_id,
             role="system",
             content=error_content,
             message_type="error",
             error=str(e)
         )
         db.add(db_message)
-        db.commit()
+        await db.commit()
         
         # Notify connected clients about error
-        await broadcast_to_session(db_session.id, {
+        await broadcast_to_session(session_id, {
             "type": "error",
             "role": "system",
             "content": db_message.content,
@@ -380,17 +505,25 @@ async def process_with_real_agent(db_session: DBSession, user_message: str, db:
 
 async def broadcast_to_session(session_id: str, message: dict):
     """Broadcast message to all connected clients for a session"""
-    if session_id in active_connections:
-        disconnected = []
-        for websocket in active_connections[session_id]:
-            try:
-                await websocket.send_text(json.dumps(message))
-            except:
-                disconnected.append(websocket)
-        
-        # Remove disconnected websockets
-        for websocket in disconnected:
-            active_connections[session_id].remove(websocket)
+    connections = active_connections.get(session_id)
+    if not connections:
+        return
+
+    # Serialize once and send to all clients concurrently, so broadcast
+    # latency is the slowest send rather than the sum of all sends.
+    # Snapshot the list first: the websocket handler may mutate it while
+    # the gather is awaited
+    conns = list(connections)
+    payload = orjson.dumps(message)
+    results = await asyncio.gather(
+        *[websocket.send_bytes(payload) for websocket in conns],
+        return_exceptions=True
+    )
+
+    # Remove websockets whose send failed (unless already removed)
+    for websocket, result in zip(conns, results):
+        if isinstance(result, Exception) and websocket in connections:
+            connections.remove(websocket)
 
 if __name__ == "__main__":
     import uvicorn
@@ -2,23 +2,27 @@
 Database migration script for MySQL integration
 """
 
+import asyncio
+
 from database import engine, Base, Session, Message
 
-def run_migrations():
+async def run_migrations():
     """Run database migrations"""
     print("Creating database tables...")
-    Base.metadata.create_all(bind=engine)
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
     print("Database tables created successfully!")
 
-def drop_tables():
+async def drop_tables():
     """Drop all tables (for development only)"""
     print("Dropping all tables...")
-    Base.metadata.drop_all(bind=engine)
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.drop_all)
     print("All tables dropped!")
 
 if __name__ == "__main__":
     import sys
     if len(sys.argv) > 1 and sys.argv[1] == "drop":
-        drop_tables()
+        asyncio.run(drop_tables())
     else:
-        run_migrations() 
\ No newline at end of file
+        asyncio.run(run_migrations())
@@ -4,10 +4,11 @@ Test script to verify agent can run in computer-use-demo container
 """
 
 import asyncio
-import json
 import sys
 import os
 
+import orjson
+
 # Set up environment
 os.environ["DISPLAY"] = ":1"
 os.environ["WIDTH"] = "1024"
@@ -34,21 +35,30 @@ async def test_agent():
         }
     ]
     
+    # Emit events as orjson bytes straight to the stdout buffer; flush per
+    # event so the backend sees each line as it happens
+    buf = sys.stdout.buffer
+
+    def emit(event):
+        buf.write(orjson.dumps(event))
+        buf.write(b"\n")
+        buf.flush()
+
     def output_callback(content_block):
         if content_block.get('type') == 'text':
-            print(json.dumps({'type': 'output', 'content': content_block['text']}))
-    
+            emit({'type': 'output', 'content': content_block['text']})
+
     def tool_output_callback(tool_result, tool_id):
-        print(json.dumps({
-            'type': 'tool_output', 
-            'tool_id': tool_id, 
-            'output': tool_result.output, 
+        emit({
+            'type': 'tool_output',
+            'tool_id': tool_id,
+            'output': tool_result.output,
             'error': tool_result.error
-        }))
-    
+        })
+
     def api_response_callback(request, response, error):
         if error:
-            print(json.dumps({'type': 'api_error', 'error': str(error)}))
+            emit({'type': 'api_error', 'error': str(error)})
     
     api_key = "sk-ant-REDACTED"
     
@@ -68,9 +78,9 @@ async def test_agent():
             thinking_budget=None,
             token_efficient_tools_beta=False,
         )
-        print(json.dumps({'type': 'success', 'message': 'Agent completed successfully'}))
+        emit({'type': 'success', 'message': 'Agent completed successfully'})
     except Exception as e:
-        print(json.dumps({'type': 'error', 'error': str(e)}))
+        emit({'type': 'error', 'error': str(e)})
 
 if __name__ == "__main__":
     asyncio.run(test_agent()) 
\ No newline at end of file